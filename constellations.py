@@ -0,0 +1,42 @@
+GPS = 0x1
+GLONASS = 0x2
+BEIDOU = 0x4
+GALILEO = 0x8
+
+# (first PRN, last PRN, bit, name) as numbered in GSA/GSV satellite fields
+PRN_RANGES = (
+    (1, 32, GPS, "GPS"),
+    (65, 88, GLONASS, "GLONASS"),
+    (201, 235, BEIDOU, "BeiDou"),
+    (301, 336, GALILEO, "Galileo"),
+)
+
+# Satellite fields are at most three digits; anything larger is malformed
+MAX_PRN = 999
+
+# Constellation named by a sentence's talker ID; GN (multi-GNSS) names none
+TALKER_SYSTEMS = {"GP": GPS, "GL": GLONASS, "GA": GALILEO, "GB": BEIDOU, "BD": BEIDOU}
+# Constellation named by the system ID field of an NMEA 4.10+ GSA sentence
+GSA_SYSTEM_IDS = {"1": GPS, "2": GLONASS, "3": GALILEO, "4": BEIDOU}
+
+_NAMES = {}
+
+
+def constellation_bit(prn):
+    for first, last, bit, _ in PRN_RANGES:
+        if first <= prn <= last:
+            return bit
+    return 0
+
+
+def satellite_system(prn, talker="", system_id=""):
+    # PRNs are reused across constellations, so the ranges are only a fallback
+    return GSA_SYSTEM_IDS.get(system_id) or TALKER_SYSTEMS.get(talker) or constellation_bit(prn)
+
+
+def constellation_names(mask):
+    names = _NAMES.get(mask)
+    if names is None:
+        names = [name for _, _, bit, name in PRN_RANGES if mask & bit]
+        _NAMES[mask] = names
+    return list(names)
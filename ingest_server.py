@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from urllib.parse import unquote
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DATA_DIR = "/mdt/home/navbox/ingest"
+SNAPSHOT_FILE = "latest.json"
+MAX_BODY = 4 * 1024 * 1024
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class PositionStore:
+    """Append-only position log with group commit and an in-memory latest-per-device view.
+
+    Records are JSON lines in numbered segment files. Concurrent appends are
+    collected for up to `commit_interval` seconds (or `max_batch` records)
+    and written with one write() and at most one fsync(); callers are
+    acknowledged only after their batch is on disk.
+    """
+
+    def __init__(self, data_dir, commit_interval=0.005, max_batch=5000, segment_bytes=256 * 1024 * 1024, fsync=True):
+        self.data_dir = data_dir
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.latest = {}
+        self.stats = {"records": 0, "commits": 0, "bytes": 0}
+        self._pending = []
+        self._waiters = []
+        self._wakeup = None
+        self._committer = None
+
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+            logger.info(f"Created ingest data directory: {data_dir}")
+        self.segment = self._recover()
+        self._open_segment()
+
+    def _segment_path(self, number):
+        return os.path.join(self.data_dir, f"positions-{number:06d}.log")
+
+    def _recover(self):
+        first = 0
+        snapshot = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot):
+            try:
+                with open(snapshot, 'r') as f:
+                    state = json.load(f)
+                self.latest = state["latest"]
+                first = state["segment"]
+            except Exception as e:
+                logger.error(f"Ignoring unreadable snapshot {snapshot}: {e}")
+
+        numbers = sorted(int(name[10:16]) for name in os.listdir(self.data_dir)
+                         if name.startswith("positions-") and name.endswith(".log"))
+        replayed = 0
+        for number in numbers:
+            if number < first:
+                continue
+            path = self._segment_path(number)
+            good = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # only the last line of a file can lack one
+                    good += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        self.latest[record["device_id"]] = record
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning(f"Skipping unreadable record in {path} at byte {good - len(line)}: {e}")
+                        continue
+                    replayed += 1
+            if good < os.path.getsize(path):
+                logger.warning(f"Truncating torn tail of {path} at byte {good}")
+                with open(path, 'r+b') as f:
+                    f.truncate(good)
+        logger.info(f"Recovered {len(self.latest)} devices ({replayed} records replayed)")
+        # A crash between writing the snapshot and creating its segment
+        # leaves the snapshot one segment ahead of the files on disk
+        return max(first, numbers[-1]) if numbers else first
+
+    def _open_segment(self):
+        path = self._segment_path(self.segment)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._torn = False
+
+    def _rotate(self):
+        # Snapshot first, so recovery only needs the segments from here on;
+        # the old segment stays open until the new one exists
+        snapshot = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        with open(snapshot + ".tmp", 'w') as f:
+            json.dump({"segment": self.segment + 1, "latest": self.latest}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(snapshot + ".tmp", snapshot)
+        old_fd = self._fd
+        self.segment += 1
+        try:
+            self._open_segment()
+        except OSError:
+            self.segment -= 1
+            raise
+        os.close(old_fd)
+        logger.info(f"Rotated to segment {self.segment}")
+
+    def _write(self, blob):
+        # After a failed write the segment may end mid-record; start on a
+        # fresh line so recovery only has to skip the torn one
+        view = memoryview(b"\n" + blob if self._torn else blob)
+        self._torn = True
+        while view:
+            view = view[os.write(self._fd, view):]
+        if self.fsync:
+            os.fsync(self._fd)
+        self._torn = False
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._committer = asyncio.ensure_future(self._commit_loop())
+
+    async def append(self, records):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.extend(records)
+        self._waiters.append(future)
+        self._wakeup.set()
+        await future
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            records, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+            if not records:
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(None)
+                continue
+
+            blob = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records).encode()
+            try:
+                # Rotating before the write means a failed rotation fails this
+                # batch (and is retried by the next) instead of the task
+                if self._size >= self.segment_bytes:
+                    await loop.run_in_executor(None, self._rotate)
+                await loop.run_in_executor(None, self._write, blob)
+            except Exception as e:
+                logger.error(f"Group commit of {len(records)} records failed: {e}")
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for record in records:
+                self.latest[record["device_id"]] = record
+            self._size += len(blob)
+            self.stats["records"] += len(records)
+            self.stats["commits"] += 1
+            self.stats["bytes"] += len(blob)
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    def close(self):
+        if self._committer:
+            self._committer.cancel()
+        os.close(self._fd)
+
+
+def validate_positions(body):
+    if isinstance(body, dict) and isinstance(body.get("positions"), list):
+        body = body["positions"]
+    items = body if isinstance(body, list) else [body]
+    if not items:
+        raise ValueError("Empty batch")
+    now = time.time()
+    records = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Position must be a JSON object")
+        device_id = item.get("device_id")
+        if not isinstance(device_id, str) or not device_id:
+            raise ValueError("Missing device_id")
+        for key in ("lat", "lon"):
+            if not isinstance(item.get(key), (int, float)) or isinstance(item.get(key), bool):
+                raise ValueError(f"Missing or non-numeric {key}")
+        record = dict(item)
+        record["received_at"] = now
+        records.append(record)
+    return records
+
+
+class IngestServer:
+    def __init__(self, store, latency=0.0, jitter=0.0, fail_rate=0.0, drop_rate=0.0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.stats = {"requests": 0, "positions": 0, "rejected": 0, "injected_failures": 0, "injected_drops": 0}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                raw_length = headers.get("content-length") or "0"
+                if not (raw_length.isascii() and raw_length.isdigit()):
+                    await self.respond(writer, 400, {"error": "Invalid Content-Length"}, False)
+                    break
+                length = int(raw_length)
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "Body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                self.stats["requests"] += 1
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+                if self.drop_rate and random.random() < self.drop_rate:
+                    self.stats["injected_drops"] += 1
+                    break
+                if self.fail_rate and random.random() < self.fail_rate:
+                    self.stats["injected_failures"] += 1
+                    await self.respond(writer, 503, {"error": "Injected failure"}, keep_alive)
+                else:
+                    status, payload = await self.route(method, target.split("?", 1)[0], body)
+                    await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except Exception as e:
+            logger.error(f"Connection error: {e}")
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path in ("/api/position", "/api/positions"):
+            if method == "GET" and path == "/api/positions":
+                return 200, self.store.latest
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            try:
+                records = validate_positions(json.loads(body))
+            except ValueError as e:
+                self.stats["rejected"] += 1
+                return 400, {"error": str(e)}
+            try:
+                await self.store.append(records)
+            except Exception as e:
+                return 503, {"error": f"Storage failure: {e}"}
+            self.stats["positions"] += len(records)
+            return 200, {"accepted": len(records)}
+
+        if path.startswith("/api/position/") and method == "GET":
+            record = self.store.latest.get(unquote(path[len("/api/position/"):]))
+            return (200, record) if record else (404, {"error": "Unknown device"})
+
+        if path == "/stats" and method == "GET":
+            return 200, {"server": self.stats, "store": self.store.stats, "devices": len(self.store.latest)}
+
+        return 404, {"error": "Not found"}
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+
+async def serve(args):
+    store = PositionStore(args.data_dir, commit_interval=args.commit_ms / 1000, max_batch=args.max_batch,
+                          segment_bytes=args.segment_mb * 1024 * 1024, fsync=not args.no_fsync)
+    store.start()
+    server = IngestServer(store, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                          fail_rate=args.fail_rate, drop_rate=args.drop_rate)
+    listener = await asyncio.start_server(server.handle_connection, args.host, args.port, backlog=1024)
+    logger.info(f"Ingest server listening on http://{args.host}:{args.port}/api/position")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the fleet position ingest service")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--commit-ms', type=float, default=5.0, help="Group commit window (ms)")
+    parser.add_argument('--max-batch', type=int, default=5000, help="Commit immediately at this many pending records")
+    parser.add_argument('--segment-mb', type=int, default=256)
+    parser.add_argument('--no-fsync', action='store_true', help="Skip fsync on commit (faster, not crash-safe)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Injected delay before each response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Extra random delay, 0..jitter")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of requests dropped without a response")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        logger.info("Ingest server stopped")
+
+
+if __name__ == "__main__":
+    main()
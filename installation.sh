@@ -95,7 +95,7 @@ chown -R "$USER:$USER" "$INSTALL_DIR"
 
 # 5. Copy application files
 echo "Copying application files..."
-for file in config.json gps_logger.py heading_calc.py main.py retry_queue.json checkgps1.py  index.html; do
+for file in config.json gps_logger.py heading_calc.py main.py raw_capture.py constellations.py satellite_state.py retry_queue.json checkgps1.py  index.html; do
     if [ -f "${SCRIPT_DIR}/${file}" ]; then
         cp "${SCRIPT_DIR}/${file}" "$INSTALL_DIR/"
         chown "$USER:$USER" "${INSTALL_DIR}/${file}"
@@ -9,12 +9,19 @@ import websockets
 import threading
 from heading_calc import calculate_heading
 from gps_logger import save_gps_log
+from raw_capture import open_captures
+from constellations import constellation_names
+from satellite_state import SatelliteState
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 RETRY_FILE = "/mdt/home/navbox/retry_queue.json"
+GGA_SENTENCES = ("$GPGGA", "$GNGGA")
+MAX_LINE_BYTES = 1024
+READ_BYTES = 4096
+BURST_GAP = 0.005  # seconds of silence that end a burst; one byte takes ~1 ms at 9600 baud
 latest_data = {}
 connected_clients = set()
 
@@ -25,15 +32,66 @@ def validate_config(config):
             raise ValueError(f"Missing required config key: {key}")
     return config
 
-def read_nmea_line(ser, sentences=("$GPGGA", "$GNGGA", "$GNGSA")):
-    try:
-        while True:
-            line = ser.readline().decode('ascii', errors='ignore').strip()
-            if line.startswith(sentences):
-                return line
-    except Exception as e:
-        logger.error(f"Error reading NMEA line: {e}")
-        return None
+class SerialReader(threading.Thread):
+    """Reads one receiver port continuously, independent of the main loop.
+
+    Reads return once the receiver goes quiet for BURST_GAP, so each burst of
+    sentences is appended to the raw capture as one record rather than byte
+    by byte. Complete lines are fed to the satellite tracker, and the most
+    recent sentence matching `sentences` is kept for the main loop to pick up
+    with take().
+    """
+
+    def __init__(self, ser, sentences=GGA_SENTENCES, capture=None, tracker=None):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.sentences = sentences
+        self.capture = capture
+        self.tracker = tracker
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.ser.inter_byte_timeout = BURST_GAP
+
+    def run(self):
+        pending = b""
+        while not self._stopping.is_set():
+            try:
+                chunk = self.ser.read(READ_BYTES)
+            except Exception as e:
+                logger.error(f"Error reading from {self.ser.port}: {e}")
+                time.sleep(1)
+                continue
+            if not chunk:
+                continue
+            if self.capture:
+                self.capture.append(chunk)
+            pending += chunk
+            if b"\n" not in chunk:
+                if len(pending) > MAX_LINE_BYTES:
+                    pending = b""
+                continue
+            *lines, pending = pending.split(b"\n")
+            for raw in lines:
+                self._handle_line(raw.decode('ascii', errors='ignore').strip())
+
+    def _handle_line(self, line):
+        if not line:
+            return
+        if self.tracker:
+            self.tracker.update(line)
+        if line.startswith(self.sentences):
+            with self._lock:
+                self._latest = line
+
+    def take(self):
+        """Return the newest matching sentence since the last call, or None."""
+        with self._lock:
+            line, self._latest = self._latest, None
+        return line
+
+    def stop(self):
+        self._stopping.set()
 
 def parse_gpgga(gpgga):
     try:
@@ -60,27 +118,6 @@ def parse_gpgga(gpgga):
         logger.error(f"Error parsing GPGGA/GNGGA: {e}")
         return None, None, 0, None, False
 
-def parse_gngsa(gngsa):
-    try:
-        parts = gngsa.split(',')
-        if len(parts) > 2:
-            satellites_used = [int(sat) for sat in parts[3:15] if sat]
-            constellations = set()
-            for sat in satellites_used:
-                if 1 <= sat <= 32:
-                    constellations.add("GPS")
-                elif 65 <= sat <= 88:
-                    constellations.add("GLONASS")
-                elif 201 <= sat <= 235:
-                    constellations.add("BeiDou")
-                elif 301 <= sat <= 336:
-                    constellations.add("Galileo")
-            return list(constellations)
-        return []
-    except Exception as e:
-        logger.error(f"Error parsing GNGSA: {e}")
-        return []
-
 def send_to_server(url, lat, lon, heading, device_id):
     data = {"device_id": device_id, "lat": lat, "lon": lon, "heading": heading}
     try:
@@ -154,12 +191,14 @@ async def websocket_handler(websocket, path):
     finally:
         connected_clients.remove(websocket)
 
+async def broadcast_message(message):
+    await asyncio.gather(*(client.send(message) for client in connected_clients))
+
 async def broadcast_data():
     global latest_data
     while True:
         if connected_clients and latest_data:
-            message = json.dumps(latest_data)
-            await asyncio.gather(*(client.send(message) for client in connected_clients))
+            await broadcast_message(json.dumps(latest_data))
         await asyncio.sleep(5)
 
 def start_websocket_server(port):
@@ -196,29 +235,35 @@ def main():
             logger.error(f"Failed to open serial ports: {e}")
             time.sleep(5)
 
-    constellations_a = []
-    constellations_b = []
-    while True:
-        try:
-            line_a = read_nmea_line(ser_a)
-            line_b = read_nmea_line(ser_b)
+    capture_a, capture_b = open_captures(config)
 
-            if line_a and line_a.startswith(("$GPGGA", "$GNGGA")):
-                lat_a, lon_a, satellites_a, hdop_a, sbas_a = parse_gpgga(line_a)
-            elif line_a and line_a.startswith("$GNGSA"):
-                constellations_a = parse_gngsa(line_a)
+    satellites_state_a = SatelliteState()
+    satellites_state_b = SatelliteState()
+    reader_a = SerialReader(ser_a, capture=capture_a, tracker=satellites_state_a)
+    reader_b = SerialReader(ser_b, capture=capture_b, tracker=satellites_state_b)
+    reader_a.start()
+    reader_b.start()
+    quality_versions = None
+    satellite_quality = {}
 
-            if line_b and line_b.startswith(("$GPGGA", "$GNGGA")):
-                lat_b, lon_b, satellites_b, hdop_b, sbas_b = parse_gpgga(line_b)
-            elif line_b and line_b.startswith("$GNGSA"):
-                constellations_b = parse_gngsa(line_b)
+    while True:
+        try:
+            # Newest GGA from each receiver since the previous cycle; a silent
+            # receiver parses as no fix
+            lat_a, lon_a, satellites_a, hdop_a, sbas_a = parse_gpgga(reader_a.take() or "")
+            lat_b, lon_b, satellites_b, hdop_b, sbas_b = parse_gpgga(reader_b.take() or "")
 
             if lat_a and lat_b:
                 heading = calculate_heading(lat_b, lon_b, lat_a, lon_a)
                 satellites = max(satellites_a, satellites_b)
                 hdop = min(hdop_a, hdop_b) if hdop_a and hdop_b else (hdop_a or hdop_b)
                 sbas = sbas_a or sbas_b
-                constellations = list(set(constellations_a + constellations_b))
+                constellations = constellation_names(satellites_state_a.constellations | satellites_state_b.constellations)
+                # Rebuilt only when either receiver's metrics have changed
+                versions = (satellites_state_a.version, satellites_state_b.version)
+                if versions != quality_versions:
+                    satellite_quality = {"a": satellites_state_a.metrics, "b": satellites_state_b.metrics}
+                    quality_versions = versions
                 logger.info(f"Position A: ({lat_a:.6f}, {lon_a:.6f}) / Heading: {heading:.2f}° / Satellites: {satellites} / HDOP: {hdop} / SBAS: {sbas} / Constellations: {constellations}")
                 latest_data = {
                     "device_id": device_id,
@@ -228,7 +273,8 @@ def main():
                     "satellites": satellites,
                     "hdop": hdop,
                     "sbas": sbas,
-                    "constellations": constellations
+                    "constellations": constellations,
+                    "satellite_quality": satellite_quality
                 }
                 save_gps_log(lat_a, lon_a, lat_b, lon_b, heading)
                 send_to_server(config['server_url'], lat_a, lon_a, heading, device_id)
@@ -240,6 +286,12 @@ def main():
 
         except KeyboardInterrupt:
             logger.info("Program interrupted")
+            for reader in (reader_a, reader_b):
+                reader.stop()
+                reader.join(timeout=2)
+            for capture in (capture_a, capture_b):
+                if capture:
+                    capture.close()
             break
         except Exception as e:
             logger.error(f"Main loop error: {e}")
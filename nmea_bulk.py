@@ -0,0 +1,510 @@
+import os
+import re
+import sys
+import logging
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from constellations import MAX_PRN, PRN_RANGES, TALKER_SYSTEMS, satellite_system
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# One row per $GPGGA/$GNGGA sentence. lat/lon/hdop are NaN where parse_gpgga()
+# returns None; constellations is the bitmask (see constellations.py) that
+# SatelliteState holds once it has read the fix: the systems used in the last
+# group of consecutive GSA sentences, of any talker, before it.
+# quality/satellites too large for an int64 are stored as -1.
+FIX_DTYPE = np.dtype([
+    ('time', 'f8'),            # seconds since UTC midnight, NaN if missing
+    ('lat', 'f8'),
+    ('lon', 'f8'),
+    ('quality', 'i8'),
+    ('satellites', 'i8'),
+    ('hdop', 'f8'),
+    ('constellations', 'u1'),
+])
+
+# Exactness: decode_buffer() matches main.parse_gpgga() and SatelliteState fed
+# line by line, bit for bit (test_nmea_bulk.py checks this). The vector path
+# holds to that because:
+#   - a layout is vector-decoded only where every field it reads is plain
+#     digits with at most one '.'; signs, exponents, spaces, non-ASCII bytes
+#     and the like go to the scalar path, which runs the same Python code as
+#     the reference
+#   - digit sums are exact: each float32 matrix product covers digits whose
+#     weighted sum stays below 2**24 even if every byte is a '9' (57), and
+#     the products are combined in float64, below 2**53
+#   - a field has at most MAX_DIGITS digits, so its mantissa is an exact
+#     float64 integer, and dividing it by the power of ten for its decimal
+#     places is a single correctly rounded step, as float() of the text is
+#   - int(raw / 100) and raw % 100 become trunc() and an exact subtraction
+#     (see _decode_gga); quality and satellites of at most MAX_DIGITS digits
+#     always fit an int64, so -1 only ever comes from the scalar path
+#   - GSA lines that may carry a system ID take the scalar path, so the
+#     vector path only needs the talker or the PRN ranges
+
+CHUNK_BYTES = 2 * 1024 * 1024
+LINE_WIDTH = 128  # NMEA caps sentences at 82 characters
+PREFIX_WIDTH = 64  # GGA fields 1-8 and GSA fields 1-14 must end within this many bytes
+FIELD_WIDTH = 16
+MAX_DIGITS = 15  # keeps the mantissa exact in a float64
+MAX_LAYOUTS = 32
+MIN_LAYOUT_ROWS = 8
+MAX_GSA_COMMAS = 17  # a GSA sentence with more may have a system ID (NMEA 4.10+ field 18)
+
+# First six bytes of a line as a little-endian integer
+_TAG_MASK = np.uint64(0xFFFFFFFFFFFF)
+_HIGH_BITS = np.uint64(0x8080808080808080)
+_LOW_BITS = np.uint64(0x7F7F7F7F7F7F7F7F)
+_ONE_BYTES = np.uint64(0x0101010101010101)
+_COMMA_BYTES = np.uint64(0x2C2C2C2C2C2C2C2C)
+# The first k bytes of a little-endian uint64, for k = 0..8
+_BYTE_MASKS = np.array([(1 << (8 * k)) - 1 for k in range(9)], dtype=np.uint64)
+_GGA_TAGS = [np.uint64(int.from_bytes(tag, 'little')) for tag in (b"$GPGGA", b"$GNGGA")]
+# SatelliteState takes any line with GSA at offset 3 for a GSA sentence
+_GSA_MASK = np.uint64(0xFFFFFF000000)
+_GSA_TAG = np.uint64(int.from_bytes(b"\0\0\0GSA", 'little'))
+# Constellation bit of every PRN a 1-3 digit GSA field can hold
+_PRN_BITS = np.zeros(MAX_PRN + 1, dtype=np.uint8)
+for _first, _last, _bit, _ in PRN_RANGES:
+    _PRN_BITS[_first:_last + 1] = _bit
+_DECIMAL = re.compile(r'\d*\.?\d*')
+_DIGIT = re.compile(r'[0-9]')
+_LAYOUT_DECIMAL = re.compile(r'0*\.?0*')
+_LAYOUT_INTEGER = re.compile(r'0+')
+
+
+def _words(padded):
+    # Every byte offset of `padded` as the start of a little-endian uint64
+    return np.ndarray((len(padded) - 7,), dtype='<u8', buffer=padded, strides=(1,))
+
+
+def _commas(data, starts, lengths):
+    # Commas in each line of up to LINE_WIDTH bytes, counted 8 bytes at a time
+    if not len(starts):
+        return lengths
+    offsets = np.arange(0, min(int(lengths.max()), LINE_WIDTH), 8)
+    x = _words(data)[starts[:, None] + offsets] ^ _COMMA_BYTES
+    # High bit of every byte that was a comma, within the line
+    x = ~(((x & _LOW_BITS) + _LOW_BITS) | x) & _HIGH_BITS
+    x &= _BYTE_MASKS[np.minimum(np.maximum(lengths[:, None] - offsets, 0), 8)]
+    return (((x >> np.uint64(7)) * _ONE_BYTES) >> np.uint64(56)).sum(axis=1)
+
+
+def _layouts(windows, starts, ends, ncommas):
+    # Group lines whose first `ncommas` fields have an identical layout: the
+    # same bytes apart from digits, so every field sits at the same columns.
+    # Yields (rows, block, bounds, fields) with field k of every row at
+    # block[:, bounds[k] + 1:bounds[k + 1]] and `fields` the first row's
+    # fields with digits shown as '0'. Rows left over go to the scalar path.
+    block = windows[starts, :PREFIX_WIDTH]
+    # Bytes shifted down by '0' with every digit zeroed, so that lines
+    # compare equal 8 bytes at a time
+    norm_words = block - np.uint8(48)
+    norm_words *= (norm_words >= 10).view(np.uint8)
+    norm_words = norm_words.view('<u8')
+    remaining = np.arange(len(starts))
+    for _ in range(MAX_LAYOUTS):
+        if len(remaining) < MIN_LAYOUT_ROWS:
+            break
+        ref = remaining[0]
+        line = block[ref, :min(ends[ref] - starts[ref], PREFIX_WIDTH)]
+        commas = np.flatnonzero(line == 44)
+        if len(commas) < ncommas or line[:commas[ncommas - 1]].max() > 127:
+            yield remaining[:1], None, None, None
+            remaining = remaining[1:]
+            continue
+
+        end = int(commas[ncommas - 1]) + 1
+        full, tail = divmod(end, 8)
+        candidates = norm_words if len(remaining) == len(norm_words) else norm_words[remaining]
+        match = candidates[:, 0] == norm_words[ref, 0]
+        for j in range(1, full):
+            match &= candidates[:, j] == norm_words[ref, j]
+        if tail:
+            mask = np.uint64((1 << (8 * tail)) - 1)
+            match &= (candidates[:, full] & mask) == (norm_words[ref, full] & mask)
+        if match.all():
+            rows, remaining = remaining, remaining[:0]
+        else:
+            rows, remaining = remaining[match], remaining[~match]
+
+        bounds = np.concatenate(([-1], commas[:ncommas]))
+        text = _DIGIT.sub('0', bytes(line[:end]).decode('ascii'))
+        fields = [text[bounds[k] + 1:bounds[k + 1]] for k in range(ncommas)]
+        yield rows, block if len(rows) == len(block) else block[rows], bounds, fields
+    yield remaining, None, None, None
+
+
+def _digits(bounds, fields, k):
+    # Block columns of the digits of field k
+    return [bounds[k] + 1 + i for i, c in enumerate(fields[k]) if c == '0']
+
+
+def _digit_sums(block, terms):
+    # One float64 array per entry of `terms`, a list of (columns, scale)
+    # pairs, holding sum(scale * int(digits at columns)) for every row. The
+    # raw bytes are weighted and summed by one float32 matrix product, split
+    # into runs that keep each sum exact (see Exactness above); runs of the
+    # same term are added in float64.
+    runs = []  # {column: weight} of every float32 run
+    plan = []  # (run, base weight) pairs making up each term
+    offsets = []
+    for term in terms:
+        digits = sorted((scale * 10 ** (len(columns) - 1 - i), col)
+                        for columns, scale in term for i, col in enumerate(columns))
+        offsets.append(48 * sum(weight for weight, _ in digits))
+        parts = []
+        for weight, col in digits:
+            if not parts or weight % parts[-1][1] or 57 * (total + weight // parts[-1][1]) >= 2 ** 24:
+                parts.append((len(runs), weight))
+                runs.append({})
+                total = 0
+            runs[-1][col] = weight // parts[-1][1]
+            total += weight // parts[-1][1]
+        plan.append(parts)
+    if not runs:
+        return [np.zeros(len(block)) for _ in terms]
+
+    first = min(min(run) for run in runs)
+    last = max(max(run) for run in runs) + 1
+    group_matrix = np.zeros((last - first, len(runs)), dtype=np.float32)
+    for g, run in enumerate(runs):
+        for col, weight in run.items():
+            group_matrix[col - first, g] = weight
+    sums = block[:, first:last].astype(np.float32) @ group_matrix
+
+    values = []
+    for parts, offset in zip(plan, offsets):
+        if not parts:
+            values.append(np.zeros(len(block)))
+        elif len(parts) == 1 and parts[0][1] == 1:
+            # A single run holds the value exactly, offset and all
+            values.append((sums[:, parts[0][0]] - np.float32(offset)).astype(np.float64))
+        else:
+            values.append(sum(sums[:, g].astype(np.float64) * base for g, base in parts) - offset)
+    return values
+
+
+def _decimals(fields):
+    # Decimal places of each field, or None if float() might not agree with
+    # plain digit parsing on some row of this layout
+    ndec = []
+    for field in fields:
+        if not _LAYOUT_DECIMAL.fullmatch(field) or not 1 <= field.count('0') <= MAX_DIGITS:
+            return None
+        ndec.append(len(field) - field.index('.') - 1 if '.' in field else 0)
+    return ndec
+
+
+def _scalar_time(field):
+    if not _DECIMAL.fullmatch(field) or len(field) > FIELD_WIDTH:
+        return np.nan
+    digits = field.replace('.', '')
+    if not 1 <= len(digits) <= MAX_DIGITS:
+        return np.nan
+    ndec = len(field) - field.index('.') - 1 if '.' in field else 0
+    mantissa = int(digits)
+    whole, frac = divmod(mantissa, 10 ** ndec)
+    return (whole // 10000 * 3600 + whole // 100 % 100 * 60 + whole % 100) + frac / float(10 ** ndec)
+
+
+def _int64(value):
+    return value if -2 ** 63 <= value < 2 ** 63 else -1
+
+
+def _scalar_gga(line):
+    # Same rules as main.parse_gpgga(), with NaN in place of None
+    parts = line.split(',')
+    time_of_day = _scalar_time(parts[1]) if len(parts) > 1 else np.nan
+    try:
+        if len(parts) > 8 and parts[2] and parts[4]:
+            raw_lat = float(parts[2])
+            lat = int(raw_lat / 100) + (raw_lat % 100) / 60
+            if parts[3] == 'S':
+                lat *= -1
+
+            raw_lon = float(parts[4])
+            lon = int(raw_lon / 100) + (raw_lon % 100) / 60
+            if parts[5] == 'W':
+                lon *= -1
+
+            satellites = int(parts[7]) if parts[7] else 0
+            hdop = float(parts[8]) if parts[8] else np.nan
+            quality = int(parts[6]) if parts[6] else 0
+            return time_of_day, lat, lon, _int64(quality), _int64(satellites), hdop
+    except Exception:
+        pass
+    return time_of_day, np.nan, np.nan, 0, 0, np.nan
+
+
+def _scalar_gsa(line):
+    # Same rules as SatelliteState._update_gsa(): the satellite_system() of
+    # every PRN in fields 3..14, up to the first one that fails to parse
+    parts = line.split('*', 1)[0].split(',')
+    system_id = parts[18] if len(parts) > 18 else ""
+    mask = 0
+    for sat in parts[3:15]:
+        if sat:
+            try:
+                prn = int(sat)
+            except ValueError:
+                break
+            if not 0 <= prn <= MAX_PRN:
+                break
+            mask |= satellite_system(prn, line[1:3], system_id)
+    return mask
+
+
+def _decode_gga(block, bounds, fields):
+    # Fields 1..8 are time, lat, N/S, lon, E/W, quality, satellites, hdop.
+    # Returns None if this layout needs the scalar path.
+    terms = []
+    time_ndec = _decimals([fields[1]]) if len(fields[1]) <= FIELD_WIDTH else None
+    if time_ndec:
+        # hhmmss as linear weights of its digits, plus the fraction
+        whole = fields[1].index('.') if '.' in fields[1] else len(fields[1])
+        if whole > 8:
+            return None
+        digits = _digits(bounds, fields, 1)
+        seconds, fraction = digits[:whole], digits[whole:]
+        terms += [[(seconds[:-4], 3600), (seconds[-4:-2], 60), (seconds[-2:], 1)], [(fraction, 1)]]
+
+    position = [2, 4, 6, 7, 8] if fields[2] and fields[4] else []
+    present = [k for k in position if fields[k]]
+    ndec = _decimals([fields[k] for k in present])
+    if ndec is None or any(not _LAYOUT_INTEGER.fullmatch(fields[k]) for k in present if k in (6, 7)):
+        return None
+    terms += [[(_digits(bounds, fields, k), 1)] for k in present]
+
+    fixes = np.zeros(len(block), dtype=FIX_DTYPE)
+    values = _digit_sums(block, terms) if terms else None
+    if time_ndec:
+        fixes['time'] = values[0] + values[1] / float(10 ** time_ndec[0])
+        values = values[2:]
+    else:
+        fixes['time'] = np.nan
+    if not position:
+        fixes['lat'] = fixes['lon'] = fixes['hdop'] = np.nan
+        return fixes
+
+    columns = dict(zip(present, values))
+    for k, n in zip(present, ndec):
+        if n:
+            columns[k] = columns[k] / float(10 ** n)
+    for name, k, hemisphere in (('lat', 2, 'S'), ('lon', 4, 'W')):
+        # int(raw / 100) + (raw % 100) / 60; the remainder is exact, so where
+        # raw / 100 rounded up to a whole number it is put back in [0, 100)
+        whole = np.trunc(columns[k] / 100)
+        minutes = columns[k] - whole * 100
+        minutes[minutes < 0] += 100
+        degrees = whole + minutes / 60
+        fixes[name] = degrees * -1 if fields[k + 1] == hemisphere else degrees
+    if 6 in columns:
+        fixes['quality'] = columns[6]
+    if 7 in columns:
+        fixes['satellites'] = columns[7]
+    fixes['hdop'] = columns[8] if 8 in columns else np.nan
+    return fixes
+
+
+def _decode_gsa(block, bounds, fields):
+    # Fields 3..14 are the PRNs used in the solution; the caller only passes
+    # lines without a system ID. Returns None if this layout needs the scalar
+    # path.
+    ks = [k for k in range(3, 15) if fields[k]]
+    if any(not _LAYOUT_INTEGER.fullmatch(fields[k]) or len(fields[k]) > 3 for k in ks):
+        return None
+    if any('*' in field for field in fields[:3]):
+        return None
+    if not ks:
+        return np.zeros(len(block), dtype=np.uint8)
+    # A talker that names a constellation applies to every PRN
+    system = TALKER_SYSTEMS.get(fields[0][1:3])
+    if system:
+        return np.full(len(block), system, dtype=np.uint8)
+
+    # The satellites in use rarely change from one sentence to the next, so
+    # only rows whose PRN fields differ from the row before are decoded
+    words = np.ndarray((len(block), PREFIX_WIDTH - 7), dtype='<u8', buffer=block, strides=(PREFIX_WIDTH, 1))
+    last = bounds[15] - 8  # the final word ends at the comma after field 14
+    changed = np.zeros(len(block), dtype=bool)
+    changed[0] = True
+    for col in list(range(bounds[3] + 1, last, 8)) + [last]:
+        changed[1:] |= words[1:, col] != words[:-1, col]
+    decoded = block if changed.all() else block[changed]
+
+    masks = np.zeros(len(decoded), dtype=np.uint8)
+    for prns in _digit_sums(decoded, [[(_digits(bounds, fields, k), 1)] for k in ks]):
+        masks |= _PRN_BITS[prns.astype(np.intp)]
+    return masks if len(decoded) == len(block) else masks[np.cumsum(changed) - 1]
+
+
+def _decode_lines(windows, starts, ends, ncommas, decode):
+    # Vector-decode the lines layout by layout; returns (rows, values, scalar rows)
+    rows, values, scalar = [], [], []
+    for group, block, bounds, fields in _layouts(windows, starts, ends, ncommas):
+        result = decode(block, bounds, fields) if fields is not None else None
+        if result is None:
+            scalar.append(group)
+        else:
+            rows.append(group)
+            values.append(result)
+    return rows, values, np.concatenate(scalar + [np.zeros(0, dtype=np.int64)])
+
+
+def _merge(rows, values, dtype):
+    # Put vector and scalar results back into line order
+    parts = [(r, v) for r, v in zip(rows, values) if len(v)]
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=dtype)
+    if len(parts) == 1:
+        return parts[0]
+    rows = np.concatenate([r for r, _ in parts])
+    values = np.concatenate([v for _, v in parts])
+    if (np.diff(rows) < 0).any():
+        order = np.argsort(rows, kind='stable')
+        rows, values = rows[order], values[order]
+    return rows, values
+
+
+def _decode_chunk(data, n, state):
+    # data holds the chunk's n bytes followed by at least LINE_WIDTH more
+    # (the next chunk, or zero padding), so every line start can be read
+    # PREFIX_WIDTH bytes wide without copying
+    buf = data[:n]
+    windows = sliding_window_view(data, PREFIX_WIDTH)
+    newlines = np.flatnonzero(buf == 10)
+    ends = newlines if n and buf[-1] == 10 else np.append(newlines, n)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # readline().decode('ascii', errors='ignore').strip() can only change a
+    # line's first six characters if it starts with whitespace or has a
+    # non-ASCII byte near the start; those lines take the scalar path. Only
+    # fields before the last comma a layout covers are vector-decoded, so
+    # trailing '\r' and whitespace never matter there.
+    tags = _words(data)[starts]
+    odd = ((tags & np.uint64(0xFF)) <= 32) | ((tags & _HIGH_BITS) != 0)
+    tags &= _TAG_MASK
+    is_gga = ~odd & ((tags == _GGA_TAGS[0]) | (tags == _GGA_TAGS[1]))
+    is_gsa = ~odd & ((tags & _GSA_MASK) == _GSA_TAG)
+
+    gi = np.flatnonzero(is_gga)
+    gga_rows, gga_fixes, slow = _decode_lines(windows, starts[gi], ends[gi], 9, _decode_gga)
+    gga_rows = [gi[r] for r in gga_rows]
+    odd[gi[slow]] = True
+
+    # A system ID can name a different constellation per line, so lines
+    # that may carry one take the scalar path
+    si = np.flatnonzero(is_gsa)
+    lengths = ends[si] - starts[si]
+    may_have_id = (lengths > LINE_WIDTH) | (_commas(data, starts[si], lengths) > MAX_GSA_COMMAS)
+    odd[si[may_have_id]] = True
+    si = si[~may_have_id]
+    gsa_rows, gsa_masks, slow = _decode_lines(windows, starts[si], ends[si], 15, _decode_gsa)
+    gsa_rows = [si[r] for r in gsa_rows]
+    odd[si[slow]] = True
+
+    # Scalar path for the lines no vector layout covers. Every line that is
+    # not a GSA sentence ends a GSA group, except blank ones, which main.py
+    # never passes to SatelliteState.
+    barrier = ~is_gsa
+    extra_gga, extra_fixes, extra_gsa, extra_masks = [], [], [], []
+    for i in np.flatnonzero(odd):
+        line = bytes(buf[starts[i]:ends[i]]).decode('ascii', errors='ignore').strip()
+        barrier[i] = bool(line) and not line.startswith("GSA", 3)
+        if line.startswith(("$GPGGA", "$GNGGA")):
+            extra_gga.append(i)
+            extra_fixes.append(_scalar_gga(line) + (0,))
+        elif line.startswith("GSA", 3):
+            extra_gsa.append(i)
+            extra_masks.append(_scalar_gsa(line))
+    gga_rows.append(np.array(extra_gga, dtype=np.int64))
+    gga_fixes.append(np.array(extra_fixes, dtype=FIX_DTYPE))
+    gsa_rows.append(np.array(extra_gsa, dtype=np.int64))
+    gsa_masks.append(np.array(extra_masks, dtype=np.uint8))
+
+    gi, fixes = _merge(gga_rows, gga_fixes, FIX_DTYPE)
+    si, masks = _merge(gsa_rows, gsa_masks, np.uint8)
+
+    # Number each GSA line's group by the barriers before it and OR the
+    # masks of every group; a group left open by the previous chunk is
+    # number 0 here. A fix, itself a barrier, sees the groups numbered below
+    # its own count of barriers, and so the last of them.
+    constellations, pending = state
+    seen = np.cumsum(barrier)
+    groups = seen[si]
+    if pending is not None:
+        groups = np.concatenate(([0], groups))
+        masks = np.concatenate(([pending], masks)).astype(np.uint8)
+    heads = np.flatnonzero(np.diff(groups, prepend=-1))
+    ids = groups[heads]
+    merged = np.bitwise_or.reduceat(masks, heads) if len(heads) else masks
+    states = np.concatenate(([constellations], merged)).astype(np.uint8)
+    fixes['constellations'] = states[np.searchsorted(ids, seen[gi])]
+
+    total = seen[-1] if len(seen) else 0
+    pending = int(states[-1]) if len(ids) and ids[-1] == total else None
+    return fixes, (int(states[np.searchsorted(ids, total)]), pending)
+
+
+def decode_buffer(data, chunk_bytes=CHUNK_BYTES):
+    """Decode every GGA sentence in a buffer of NMEA text into a FIX_DTYPE array."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    results = []
+    state = (0, None)  # (constellations, mask of an unfinished GSA group)
+    pos = 0
+    while pos < len(buf):
+        stop = min(pos + chunk_bytes, len(buf))
+        if stop < len(buf):
+            newline = np.flatnonzero(buf[max(pos, stop - LINE_WIDTH):stop] == 10)
+            if len(newline):
+                stop = max(pos, stop - LINE_WIDTH) + int(newline[-1]) + 1
+            else:
+                newline = np.flatnonzero(buf[pos:stop] == 10)
+                if len(newline):
+                    stop = pos + int(newline[-1]) + 1
+                else:
+                    found = np.flatnonzero(buf[stop:] == 10)
+                    stop = stop + int(found[0]) + 1 if len(found) else len(buf)
+        if stop + LINE_WIDTH <= len(buf):
+            chunk = buf[pos:stop + LINE_WIDTH]
+        else:
+            chunk = np.concatenate((buf[pos:stop], np.zeros(LINE_WIDTH, dtype=np.uint8)))
+        fixes, state = _decode_chunk(chunk, stop - pos, state)
+        results.append(fixes)
+        pos = stop
+    if not results:
+        return np.zeros(0, dtype=FIX_DTYPE)
+    return np.concatenate(results)
+
+
+def decode_file(path, chunk_bytes=CHUNK_BYTES):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=FIX_DTYPE)
+    return decode_buffer(np.memmap(path, dtype=np.uint8, mode='r'), chunk_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-decode recorded NMEA into a NumPy fix array")
+    parser.add_argument('input', help="NMEA text file, e.g. an export from raw_capture.py")
+    parser.add_argument('--output', help="Save the fix array to this .npy file")
+    args = parser.parse_args()
+
+    try:
+        fixes = decode_file(args.input)
+    except Exception as e:
+        logger.error(f"Failed to decode {args.input}: {e}")
+        sys.exit(1)
+
+    valid = ~np.isnan(fixes['lat'])
+    logger.info(f"Decoded {len(fixes)} GGA sentences, {int(valid.sum())} with a position")
+    if args.output:
+        np.save(args.output, fixes)
+        logger.info(f"Saved fixes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
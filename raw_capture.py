@@ -0,0 +1,196 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import logging
+import argparse
+from datetime import datetime
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ring file layout:
+#   header  : magic, data capacity, head (next write offset), tail (oldest record), used bytes
+#   records : [timestamp (float64), length (uint32)] followed by `length` raw bytes
+# Records never straddle the end of the data area. When one does not fit, the
+# remaining bytes become a gap (marked with PAD_LENGTH if a record header fits)
+# and writing continues at offset 0, evicting the oldest records as it goes.
+MAGIC = b"NAVRAW1\0"
+HEADER = struct.Struct('<8sQQQQ')
+RECORD = struct.Struct('<dI')
+PAD_LENGTH = 0xFFFFFFFF
+DEFAULT_SIZE_MB = 64
+
+
+class RawCapture:
+    def __init__(self, path, size=DEFAULT_SIZE_MB * 1024 * 1024):
+        self.path = path
+        capacity = size - HEADER.size
+        if capacity < RECORD.size * 16:
+            raise ValueError(f"Raw capture size too small: {size}")
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+            logger.info(f"Created raw capture directory: {directory}")
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, stored_capacity, head, tail, used = HEADER.unpack_from(self._mm, 0)
+        if existing == size and magic == MAGIC and stored_capacity == capacity:
+            self.capacity, self.head, self.tail, self.used = capacity, head, tail, used
+            logger.info(f"Resumed raw capture ring {path} ({used} of {capacity} bytes used)")
+        else:
+            self.capacity, self.head, self.tail, self.used = capacity, 0, 0, 0
+            self._write_header()
+            logger.info(f"Initialized raw capture ring {path} ({capacity} bytes)")
+
+    def _write_header(self):
+        HEADER.pack_into(self._mm, 0, MAGIC, self.capacity, self.head, self.tail, self.used)
+
+    def _evict_oldest(self):
+        offset = HEADER.size + self.tail
+        if self.capacity - self.tail < RECORD.size:
+            length = PAD_LENGTH
+        else:
+            _, length = RECORD.unpack_from(self._mm, offset)
+        if length == PAD_LENGTH:
+            self.used -= self.capacity - self.tail
+            self.tail = 0
+        else:
+            size = RECORD.size + length
+            self.used -= size
+            self.tail += size
+            if self.tail == self.capacity:
+                self.tail = 0
+
+    def append(self, chunk, timestamp=None):
+        size = RECORD.size + len(chunk)
+        if not chunk or size > self.capacity:
+            return
+        try:
+            if self.head + size > self.capacity:
+                while self.used and self.tail >= self.head:
+                    self._evict_oldest()
+                if self.capacity - self.head >= RECORD.size:
+                    RECORD.pack_into(self._mm, HEADER.size + self.head, 0.0, PAD_LENGTH)
+                self.used += self.capacity - self.head
+                self.head = 0
+
+            while self.used and self.head <= self.tail < self.head + size:
+                self._evict_oldest()
+            if not self.used:
+                self.tail = self.head
+
+            offset = HEADER.size + self.head
+            RECORD.pack_into(self._mm, offset, time.time() if timestamp is None else timestamp, len(chunk))
+            self._mm[offset + RECORD.size:offset + size] = chunk
+            self.head += size
+            self.used += size
+            if self.head == self.capacity:
+                self.head = 0
+            self._write_header()
+        except Exception as e:
+            logger.error(f"Error writing raw capture {self.path}: {e}")
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.flush()
+            self._mm.close()
+
+
+def read_records(path, start=None, end=None):
+    """Yield (timestamp, raw_bytes) from a ring file, oldest first, within [start, end)."""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, capacity, _, tail, used = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a raw capture file: {path}")
+
+        while used > 0:
+            offset = HEADER.size + tail
+            if capacity - tail < RECORD.size:
+                length = PAD_LENGTH
+            else:
+                timestamp, length = RECORD.unpack_from(mm, offset)
+            if length == PAD_LENGTH:
+                used -= capacity - tail
+                tail = 0
+                continue
+            size = RECORD.size + length
+            if size > used:
+                break
+            if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                yield timestamp, mm[offset + RECORD.size:offset + size]
+            used -= size
+            tail += size
+            if tail == capacity:
+                tail = 0
+    finally:
+        mm.close()
+
+
+def export_window(path, out, start=None, end=None):
+    count = 0
+    for _, chunk in read_records(path, start, end):
+        out.write(chunk)
+        count += 1
+    return count
+
+
+def open_captures(config):
+    capture_dir = config.get('raw_capture_dir')
+    if not capture_dir:
+        return None, None
+    size = int(config.get('raw_capture_size_mb', DEFAULT_SIZE_MB)) * 1024 * 1024
+    try:
+        return (RawCapture(os.path.join(capture_dir, "raw_a.ring"), size),
+                RawCapture(os.path.join(capture_dir, "raw_b.ring"), size))
+    except Exception as e:
+        logger.error(f"Failed to open raw capture files, capture disabled: {e}")
+        return None, None
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export raw NMEA bytes from a NavBox capture ring")
+    parser.add_argument('ring', help="Ring file, e.g. /mdt/home/navbox/raw/raw_a.ring")
+    parser.add_argument('--start', type=_parse_time, help="Window start (epoch seconds or ISO 8601)")
+    parser.add_argument('--end', type=_parse_time, help="Window end (epoch seconds or ISO 8601)")
+    parser.add_argument('--output', help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        if args.output:
+            with open(args.output, 'wb') as out:
+                count = export_window(args.ring, out, args.start, args.end)
+        else:
+            count = export_window(args.ring, sys.stdout.buffer, args.start, args.end)
+            sys.stdout.buffer.flush()
+    except Exception as e:
+        logger.error(f"Failed to export raw capture: {e}")
+        sys.exit(1)
+    logger.info(f"Exported {count} chunks from {args.ring}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import logging
+from constellations import MAX_PRN, satellite_system
+
+logger = logging.getLogger(__name__)
+
+
+class SatelliteState:
+    """Per-receiver satellite state built incrementally from GSA and GSV sentences.
+
+    Satellites are identified by (system, PRN), the system being a
+    constellation bit (see constellations.py) taken from the GSA system ID
+    or the talker, and from the PRN's range only when neither names one.
+    Satellites used in the fix are kept as a PRN bitset per system and
+    constellations as a bitmask. GSV reports update per-satellite elevation
+    and SNR. `metrics` is replaced, and `version` bumped, only when a
+    completed GSA group or GSV cycle actually changes it.
+    """
+
+    def __init__(self):
+        self.used = {}         # system -> PRN bitset
+        self.constellations = 0
+        self.metrics = {}
+        self.version = 0
+        self._pending_used = None
+        self._sky = {}         # (talker, signal) -> {(system, prn): (elevation, snr)}
+        self._cycles = {}      # (talker, signal) -> GSV cycle being collected
+
+    def update(self, line):
+        """Feed one NMEA sentence."""
+        try:
+            if line.startswith("GSA", 3):
+                self._update_gsa(line)
+                return
+            self._end_gsa_group()
+            if line.startswith("GSV", 3):
+                self._update_gsv(line)
+        except Exception as e:
+            logger.error(f"Error updating satellite state from {line[:6]}: {e}")
+
+    def _update_gsa(self, line):
+        # Receivers emit one GSA per constellation back to back, so a group of
+        # consecutive GSA sentences together describes the current fix
+        if self._pending_used is None:
+            self._pending_used = {}
+        parts = line.split('*', 1)[0].split(',')
+        system_id = parts[18] if len(parts) > 18 else ""
+        for sat in parts[3:15]:
+            if sat:
+                prn = int(sat)
+                if not 0 <= prn <= MAX_PRN:
+                    raise ValueError(f"PRN {prn} out of range")
+                system = satellite_system(prn, line[1:3], system_id)
+                self._pending_used[system] = self._pending_used.get(system, 0) | 1 << prn
+
+    def _end_gsa_group(self):
+        used, self._pending_used = self._pending_used, None
+        if used is None or used == self.used:
+            return
+        self.used = used
+        self.constellations = 0
+        for system in used:
+            self.constellations |= system
+        self._publish()
+
+    def _update_gsv(self, line):
+        parts = line.split('*', 1)[0].split(',')
+        total, number = int(parts[1]), int(parts[2])
+        blocks = parts[4:]
+        signal = blocks.pop() if len(blocks) % 4 == 1 else ""
+        key = (line[1:3], signal)
+
+        if number == 1:
+            self._cycles[key] = {}
+        cycle = self._cycles.get(key)
+        if cycle is None:
+            return
+        for i in range(0, len(blocks) - 3, 4):
+            prn, elevation, _, snr = blocks[i:i + 4]
+            if prn:
+                prn = int(prn)
+                cycle[(satellite_system(prn, line[1:3]), prn)] = (
+                    int(elevation) if elevation else None, int(snr) if snr else None)
+        if number < total:
+            return
+
+        del self._cycles[key]
+        if self._sky.get(key) == cycle:
+            return
+        self._sky[key] = cycle
+        self._publish()
+
+    def satellites(self):
+        """{(system, prn): (elevation, snr)} for every satellite in view."""
+        merged = {}
+        for sky in self._sky.values():
+            for sat, (elevation, snr) in sky.items():
+                known = merged.get(sat)
+                if known is None or (snr is not None and (known[1] is None or snr > known[1])):
+                    merged[sat] = (elevation, snr)
+        return merged
+
+    def _publish(self):
+        in_view = self.satellites()
+        used = [in_view[sat] for sat in in_view if self.used.get(sat[0], 0) >> sat[1] & 1]
+        snrs = [snr for _, snr in used if snr is not None]
+        elevations = [elevation for elevation, _ in used if elevation is not None]
+        metrics = {
+            "satellites_used": sum(bin(prns).count("1") for prns in self.used.values()),
+            "satellites_in_view": len(in_view),
+            "satellites_tracked": sum(snr is not None for _, snr in in_view.values()),
+            "constellations": self.constellations,
+            "snr_avg": round(sum(snrs) / len(snrs), 1) if snrs else None,
+            "snr_min": min(snrs) if snrs else None,
+            "elevation_min": min(elevations) if elevations else None,
+        }
+        if metrics != self.metrics:
+            self.metrics = metrics
+            self.version += 1
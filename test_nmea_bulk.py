@@ -0,0 +1,246 @@
+import re
+import sys
+import math
+import random
+import logging
+import argparse
+import numpy as np
+import nmea_bulk
+from main import GGA_SENTENCES, parse_gpgga
+from satellite_state import SatelliteState
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Checks nmea_bulk.decode_buffer() against the line-by-line path it replaces:
+# main.parse_gpgga() for each GGA sentence and SatelliteState for the
+# constellations. Runs under pytest or as a script (python test_nmea_bulk.py).
+
+CHUNK_SIZES = (64, 200, 4096, nmea_bulk.CHUNK_BYTES)
+TALKERS = ("$GNGSA", "$GNGSA", "$GPGSA", "$GLGSA", "$GAGSA", "$GBGSA", "$BDGSA", "$GXGSA")
+ODD_VALUES = ("-12.5", "+3", "1e3", "1E2", " 12", "12 ", "1_0", "1.2.3", ".", "", "nan", "inf",
+              "é12", "12°", "99999999999999999999", "-99999999999999999999", "0x1")
+
+
+def _reference_time(line):
+    # hhmmss[.ss] as seconds since midnight, as FIX_DTYPE stores it
+    parts = line.split(',')
+    field = parts[1] if len(parts) > 1 else ""
+    if not re.fullmatch(r'\d*\.?\d*', field) or len(field) > nmea_bulk.FIELD_WIDTH:
+        return math.nan
+    whole, _, frac = field.partition('.')
+    if not 1 <= len(whole + frac) <= nmea_bulk.MAX_DIGITS:
+        return math.nan
+    whole = int(whole) if whole else 0
+    seconds = whole // 10000 * 3600 + whole // 100 % 100 * 60 + whole % 100
+    return seconds + (int(frac) / float(10 ** len(frac)) if frac else 0.0)
+
+
+def _reference_quality(line, lat):
+    if lat is None:
+        return 0
+    quality = line.split(',')[6]
+    quality = int(quality) if quality else 0
+    return quality if -2 ** 63 <= quality < 2 ** 63 else -1
+
+
+def reference(data):
+    """The FIX_DTYPE rows main.py would produce reading `data` line by line."""
+    logging.disable(logging.CRITICAL)
+    try:
+        state = SatelliteState()
+        rows = []
+        for raw in data.split(b"\n"):
+            line = raw.decode('ascii', errors='ignore').strip()
+            if not line:
+                continue
+            state.update(line)
+            if line.startswith(GGA_SENTENCES):
+                lat, lon, satellites, hdop, _ = parse_gpgga(line)
+                rows.append((_reference_time(line),
+                             math.nan if lat is None else lat,
+                             math.nan if lon is None else lon,
+                             _reference_quality(line, lat),
+                             satellites if -2 ** 63 <= satellites < 2 ** 63 else -1,
+                             math.nan if hdop is None else hdop,
+                             state.constellations))
+        return np.array(rows, dtype=nmea_bulk.FIX_DTYPE)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def check(data, chunk_sizes=CHUNK_SIZES):
+    expected = reference(data)
+    for chunk_bytes in chunk_sizes:
+        fixes = nmea_bulk.decode_buffer(data, chunk_bytes)
+        assert len(fixes) == len(expected), f"chunk_bytes={chunk_bytes}: {len(fixes)} fixes, expected {len(expected)}"
+        for name in nmea_bulk.FIX_DTYPE.names:
+            # Compared as raw bits, so NaNs match and -0.0 differs from 0.0
+            got, want = fixes[name], expected[name]
+            if got.dtype.kind == 'f':
+                got, want = got.view(np.int64), want.view(np.int64)
+            bad = np.flatnonzero(got != want)
+            assert not len(bad), (f"chunk_bytes={chunk_bytes}: {name} differs in fix {bad[0]}: "
+                                  f"{fixes[bad[0]]} != {expected[bad[0]]}")
+
+
+def _digits(rng, n):
+    return "".join(rng.choice("0123456789") for _ in range(n))
+
+
+def _number(rng, whole, decimals):
+    text = _digits(rng, whole)
+    return text + "." + _digits(rng, decimals) if decimals is not None else text
+
+
+def _gga_layout(rng):
+    # Digit counts per field, so that every line drawn from it shares a layout
+    return {
+        "tag": rng.choice(GGA_SENTENCES),
+        "time": rng.choice([(6, None), (6, 2), (6, 3), (4, 1), (0, None)]),
+        "lat": (rng.randint(0, 6), rng.choice([None, 0, 2, 4, 6, 9])),
+        "lon": (rng.randint(0, 7), rng.choice([None, 0, 2, 4, 6, 9])),
+        "ns": rng.choice("NS"),
+        "ew": rng.choice("EW"),
+        "quality": rng.choice([1, 1, 2, 0]),
+        "satellites": rng.choice([1, 2, 2, 0]),
+        "hdop": (rng.randint(0, 3), rng.choice([None, 1, 2])),
+    }
+
+
+def _gga_line(rng, layout):
+    fields = [layout["tag"],
+              _number(rng, *layout["time"]) if layout["time"][0] else "",
+              _number(rng, *layout["lat"]), layout["ns"],
+              _number(rng, *layout["lon"]), layout["ew"],
+              _digits(rng, layout["quality"]), _digits(rng, layout["satellites"]),
+              _number(rng, *layout["hdop"]), "545.4", "M", "46.9", "M", "", ""]
+    return ",".join(fields) + "*47"
+
+
+def _gsa_layout(rng):
+    width = rng.choice([2, 2, 3, 1])
+    return {
+        "tag": rng.choice(TALKERS),
+        "used": [rng.random() < 0.5 for _ in range(12)],
+        "width": width,
+        "system_id": rng.random() < 0.1,
+    }
+
+
+def _gsa_line(rng, layout):
+    limit = 10 ** layout["width"] - 1
+    prns = [str(rng.randint(1, min(limit, 340))).zfill(layout["width"]) if used else ""
+            for used in layout["used"]]
+    fields = [layout["tag"], "A", "3"] + prns + ["1.5", "0.9", "1.2"]
+    if layout["system_id"]:
+        fields.append(rng.choice("12345"))
+    return ",".join(fields) + "*3E"
+
+
+def _odd_line(rng, gga, gsa):
+    # A sentence the vector path has to hand to the scalar path
+    kind = rng.randrange(6)
+    if kind == 0:
+        fields = gga.split(',')
+        fields[rng.choice([1, 2, 4, 6, 7, 8])] = rng.choice(ODD_VALUES)
+        return ",".join(fields)
+    if kind == 1:
+        fields = gsa.split(',')
+        fields[rng.randint(3, 14)] = rng.choice(ODD_VALUES)
+        return ",".join(fields)
+    if kind == 2:
+        return rng.choice(" \t") + rng.choice((gga, gsa))
+    if kind == 3:
+        return "é" + rng.choice((gga, gsa))
+    if kind == 4:
+        return rng.choice(("", "   ", "éé", "$GPGSV,3,1,11,03,03,111,00", "$GNRMC,", "garbage"))
+    return gga[:rng.randint(1, len(gga))]
+
+
+def random_capture(rng, lines, odd_fraction):
+    """NMEA text from a handful of random layouts, with some odd lines mixed in."""
+    gga_layouts = [_gga_layout(rng) for _ in range(rng.randint(1, 6))]
+    gsa_layouts = [_gsa_layout(rng) for _ in range(rng.randint(1, 6))]
+    out = []
+    while len(out) < lines:
+        gga = _gga_line(rng, rng.choice(gga_layouts))
+        group = [_gsa_line(rng, rng.choice(gsa_layouts)) for _ in range(rng.choice([0, 1, 1, 2, 3]))]
+        for line in group + [gga]:
+            if rng.random() < odd_fraction:
+                out.append(_odd_line(rng, gga, group[0] if group else _gsa_line(rng, gsa_layouts[0])))
+            out.append(line)
+    text = "".join(line + rng.choice(("\r\n", "\r\n", "\n", " \r\n")) for line in out)
+    if rng.random() < 0.5:
+        text = text.rstrip("\n")
+    return text.encode('utf-8')
+
+
+def test_random_layouts(seed=0, rounds=10):
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        check(random_capture(rng, 2000, 0.0), chunk_sizes=(nmea_bulk.CHUNK_BYTES,))
+
+
+def test_chunk_boundaries(seed=1, rounds=5):
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        data = random_capture(rng, 500, 0.05)
+        check(data, chunk_sizes=CHUNK_SIZES + tuple(rng.randint(1, 300) for _ in range(5)))
+
+
+def test_scalar_fallback(seed=2, rounds=10):
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        check(random_capture(rng, 2000, 0.2))
+
+
+def test_int64_overflow():
+    # Repeated so the lines form a layout before falling back to the scalar path
+    fields = ["$GNGGA", "123519", "4807.038", "N", "01131.000", "E", "1", "08", "0.9", "545.4", "M"]
+    lines = []
+    for quality, satellites in (("1", "99999999999999999999"), ("99999999999999999999", "08"),
+                                ("9223372036854775808", "9223372036854775807"), ("1", "-9223372036854775809")):
+        fields[6], fields[7] = quality, satellites
+        lines += [",".join(fields)] * nmea_bulk.MIN_LAYOUT_ROWS
+    data = ("\r\n".join(lines) + "\r\n").encode('ascii')
+    check(data)
+    fixes = nmea_bulk.decode_buffer(data)
+    assert set(fixes['satellites']) == {-1, 8, 2 ** 63 - 1}
+    assert set(fixes['quality']) == {1, -1}
+
+
+def test_gsa_groups():
+    # Consecutive GSA sentences of any talker make up one fix's constellations
+    data = (b"$GNGSA,A,3,05,07,,,,,,,,,,,1.5,0.9,1.2,3*3A\r\n"
+            b"$GPGSA,A,3,12,,,,,,,,,,,,1.5,0.9,1.2*3A\r\n"
+            b"$GNGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n")
+    check(data)
+    assert nmea_bulk.decode_buffer(data)['constellations'][0] == 0x1 | 0x8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check nmea_bulk against the line-by-line parsers")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    checks = [("random layouts", lambda: test_random_layouts(args.seed, args.rounds)),
+              ("chunk boundaries", lambda: test_chunk_boundaries(args.seed + 1, args.rounds)),
+              ("scalar fallback", lambda: test_scalar_fallback(args.seed + 2, args.rounds)),
+              ("int64 overflow", test_int64_overflow),
+              ("GSA groups", test_gsa_groups)]
+    failed = 0
+    for name, run in checks:
+        try:
+            run()
+            logger.info(f"{name}: ok")
+        except AssertionError as e:
+            logger.error(f"{name}: {e}")
+            failed += 1
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
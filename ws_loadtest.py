@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from datetime import datetime
+import websockets
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Client:
+    def __init__(self, kind):
+        self.kind = kind          # "normal", "slow" or "stalled"
+        self.connected = False
+        self.error = None
+        self.frames = []          # (receive time, seq, sent_at)
+
+
+def read_process_stats(pid):
+    # Cumulative CPU seconds and current RSS in bytes, from /proc
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+        return cpu, rss
+    except Exception as e:
+        logger.warning(f"Failed to read stats for pid {pid}: {e}")
+        return None, None
+
+
+def serve_local(port, rate):
+    # Child process: main.py's WebSocket handler and fan-out, fed with
+    # sequence-numbered, timestamped frames at `rate` Hz
+    import main
+
+    async def handler(websocket, path=None):
+        await main.websocket_handler(websocket, path)
+
+    async def feed():
+        seq = 0
+        while True:
+            seq += 1
+            main.latest_data = {"device_id": "LOADTEST", "lat": 0.0, "lon": 0.0, "heading": 0.0,
+                                "seq": seq, "sent_at": time.time()}
+            if main.connected_clients:
+                try:
+                    await main.broadcast_message(json.dumps(main.latest_data))
+                except Exception as e:
+                    logger.error(f"Broadcast failed: {e}")
+            await asyncio.sleep(1 / rate)
+
+    async def run():
+        async with websockets.serve(handler, "127.0.0.1", port, max_size=None):
+            await feed()
+
+    logging.getLogger('websockets').setLevel(logging.WARNING)
+    asyncio.run(run())
+
+
+async def run_client(url, client, slow_delay, stop):
+    try:
+        async with websockets.connect(url, max_queue=1 if client.kind == "stalled" else 64,
+                                      open_timeout=60, ping_interval=None) as ws:
+            client.connected = True
+            if client.kind == "stalled":
+                await stop.wait()
+                return
+            async for message in ws:
+                now = time.time()
+                try:
+                    data = json.loads(message)
+                    client.frames.append((now, data.get("seq"), data.get("sent_at")))
+                except ValueError:
+                    client.frames.append((now, None, None))
+                if client.kind == "slow":
+                    await asyncio.sleep(slow_delay)
+                if stop.is_set():
+                    return
+    except Exception as e:
+        client.error = str(e) or type(e).__name__
+    finally:
+        client.connected = False
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"p50": round(pick(0.50) * 1000, 2), "p90": round(pick(0.90) * 1000, 2),
+            "p99": round(pick(0.99) * 1000, 2), "max": round(values[-1] * 1000, 2)}
+
+
+def group_rounds(times, gap):
+    # Without sequence numbers a broadcast round is a burst of receipts
+    # separated from the next one by at least `gap` seconds
+    rounds = []
+    for t in sorted(times):
+        if not rounds or t - rounds[-1][-1] > gap:
+            rounds.append([t])
+        else:
+            rounds[-1].append(t)
+    return rounds
+
+
+def summarize(clients, window_start, window_end, round_gap):
+    readers = [c for c in clients if c.kind != "stalled" and c.error is None]
+    in_window = {id(c): [f for f in c.frames if window_start <= f[0] < window_end] for c in readers}
+    sequenced = any(f[1] is not None for frames in in_window.values() for f in frames)
+
+    if sequenced:
+        # Frames sent inside the window, early enough that every reader had
+        # `round_gap` seconds to receive them
+        expected = {f[1] for frames in in_window.values() for f in frames
+                    if f[2] is not None and window_start <= f[2] < window_end - round_gap}
+        latencies = [f[0] - f[2] for c in readers if c.kind == "normal"
+                     for f in in_window[id(c)] if f[1] in expected]
+    else:
+        normal_times = [f[0] for c in readers if c.kind == "normal" for f in in_window[id(c)]]
+        rounds = [r for r in group_rounds(normal_times, round_gap) if r[-1] < window_end - round_gap]
+        expected = set(range(len(rounds)))
+        latencies = [t - r[0] for r in rounds for t in r]
+
+    # Frames a client had not received by the end of the window. Normal
+    # clients keep up, so for them this is real loss; slow clients sleep per
+    # frame and fall behind the queue, which is not the same thing
+    def missing(kind):
+        members = [c for c in readers if c.kind == kind]
+        if sequenced:
+            received = sum(len({f[1] for f in in_window[id(c)]} & expected) for c in members)
+        else:
+            received = sum(min(len(in_window[id(c)]), len(expected)) for c in members)
+        return len(expected) * len(members) - received
+
+    return {
+        "frames_expected": len(expected),
+        "latency_ms": percentiles(latencies),
+        "latency_basis": "sent_at" if sequenced else "first_receipt_in_round",
+        "dropped_frames": missing("normal"),
+        "frames_behind": missing("slow"),
+    }
+
+
+async def run_steps(args, server_pid):
+    stop = asyncio.Event()
+    clients, tasks, steps = [], [], []
+    kinds = (["stalled"] * int(args.stalled_fraction * 1000) + ["slow"] * int(args.slow_fraction * 1000))
+    kinds += ["normal"] * (1000 - len(kinds))
+    rng = random.Random(args.seed)
+
+    for target in args.clients:
+        connect_started = time.time()
+        while len(clients) < target:
+            batch = min(args.connect_batch, target - len(clients))
+            for _ in range(batch):
+                client = Client(rng.choice(kinds))
+                clients.append(client)
+                tasks.append(asyncio.ensure_future(run_client(args.url, client, args.slow_delay, stop)))
+            await asyncio.sleep(args.connect_pause)
+        deadline = time.time() + args.connect_timeout
+        while time.time() < deadline and sum(c.connected or c.error is not None for c in clients) < len(clients):
+            await asyncio.sleep(0.1)
+        connect_time = time.time() - connect_started
+        await asyncio.sleep(args.settle)
+
+        server_before = read_process_stats(server_pid) if server_pid else (None, None)
+        own_before = read_process_stats(os.getpid())
+        window_start = time.time()
+        await asyncio.sleep(args.duration)
+        window_end = time.time()
+        server_after = read_process_stats(server_pid) if server_pid else (None, None)
+        own_after = read_process_stats(os.getpid())
+
+        elapsed = window_end - window_start
+        step = {
+            "clients": target,
+            "connected": sum(c.connected for c in clients),
+            "connect_failures": sum(c.error is not None for c in clients),
+            "connect_seconds": round(connect_time, 2),
+            "mix": {kind: sum(c.kind == kind for c in clients) for kind in ("normal", "slow", "stalled")},
+        }
+        step.update(summarize(clients, window_start, window_end, args.round_gap))
+        if server_before[0] is not None and server_after[0] is not None:
+            step["server_cpu_percent"] = round((server_after[0] - server_before[0]) / elapsed * 100, 1)
+            step["server_rss_mb"] = round(server_after[1] / 1048576, 1)
+        else:
+            step["server_cpu_percent"] = step["server_rss_mb"] = None
+        step["loadgen_cpu_percent"] = round((own_after[0] - own_before[0]) / elapsed * 100, 1)
+        steps.append(step)
+
+        latency = step["latency_ms"] or {}
+        logger.info(f"{target} clients: connected {step['connected']}, failures {step['connect_failures']}, "
+                    f"p50 {latency.get('p50')} ms, p99 {latency.get('p99')} ms, "
+                    f"dropped {step['dropped_frames']}, slow clients behind {step['frames_behind']}, server CPU {step['server_cpu_percent']}%, "
+                    f"RSS {step['server_rss_mb']} MB")
+        for client in clients:
+            client.frames.clear()
+
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return steps
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket fan-out load test for the NavBox position feed")
+    parser.add_argument('--url', help="Existing server, e.g. ws://navbox:8080/api/position (default: start a local instance)")
+    parser.add_argument('--server-pid', type=int, help="PID of the server behind --url, for CPU/RSS sampling")
+    parser.add_argument('--port', type=int, default=18080, help="Port for the local instance")
+    parser.add_argument('--rate', type=float, default=1.0, help="Broadcast rate of the local instance (Hz)")
+    parser.add_argument('--clients', default="100,500,1000,2000", help="Comma-separated client counts to step through")
+    parser.add_argument('--slow-fraction', type=float, default=0.05)
+    parser.add_argument('--slow-delay', type=float, default=2.0, help="Seconds a slow client sleeps per frame")
+    parser.add_argument('--stalled-fraction', type=float, default=0.01)
+    parser.add_argument('--duration', type=float, default=30.0, help="Measurement window per step (s)")
+    parser.add_argument('--settle', type=float, default=2.0)
+    parser.add_argument('--connect-batch', type=int, default=100)
+    parser.add_argument('--connect-pause', type=float, default=0.05)
+    parser.add_argument('--connect-timeout', type=float, default=60.0)
+    parser.add_argument('--round-gap', type=float, default=1.0,
+                        help="Quiet gap that separates broadcast rounds from a server without sequence numbers")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default="ws_loadtest_report.json")
+    args = parser.parse_args()
+    args.clients = sorted(int(n) for n in args.clients.split(','))
+
+    fd_limit = raise_fd_limit()
+    if fd_limit < args.clients[-1] + 64:
+        logger.warning(f"Open file limit {fd_limit} is below {args.clients[-1]} clients; raise it with ulimit -n")
+    logging.getLogger('websockets').setLevel(logging.WARNING)
+
+    server = None
+    server_pid = args.server_pid
+    if not args.url:
+        server = multiprocessing.Process(target=serve_local, args=(args.port, args.rate), daemon=True)
+        server.start()
+        server_pid = server.pid
+        args.url = f"ws://127.0.0.1:{args.port}/api/position"
+        time.sleep(1)
+        logger.info(f"Started local instance (pid {server_pid}) on {args.url}")
+
+    try:
+        steps = asyncio.run(run_steps(args, server_pid))
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+
+    report = {
+        "tool": "ws_loadtest",
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "git_commit": git_commit(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "websockets": websockets.__version__,
+        "mode": "local" if server else "external",
+        "url": args.url,
+        "settings": {key: getattr(args, key) for key in
+                     ("rate", "slow_fraction", "slow_delay", "stalled_fraction", "duration", "round_gap")},
+        "steps": steps,
+    }
+    try:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Wrote report to {args.output}")
+    except Exception as e:
+        logger.error(f"Failed to write report: {e}")
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()